@@ -1,12 +1,13 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 import aiohttp
+import orjson
 import asyncio
 import re
 import time
-import hashlib
-from typing import Optional, Dict, Any, List
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
 import logging
 from contextlib import asynccontextmanager
 
@@ -14,6 +15,97 @@ from contextlib import asynccontextmanager
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Shared HTTP session for Ollama calls (created in lifespan)
+SESSION: Optional[aiohttp.ClientSession] = None
+_HEALTH_TIMEOUT = aiohttp.ClientTimeout(total=5)
+_GEN_TIMEOUT = aiohttp.ClientTimeout(total=60)
+# Cap on in-flight Ollama generate calls per worker; excess requests get a 429 (see AIBusyError)
+MAX_CONCURRENT_AI_REQUESTS = 8
+_AI_SEM = asyncio.Semaphore(MAX_CONCURRENT_AI_REQUESTS)
+_JSON_HEADERS = {"Content-Type": "application/json"}
+_OLLAMA_OPTIONS = {
+    "temperature": 0.1,
+    "top_p": 0.8,
+    "num_predict": 500,
+    "num_thread": 6,
+    "repeat_penalty": 1.2
+}
+
+# Cached Ollama health check result (seconds, monotonic clock)
+OLLAMA_STATUS_TTL = 10.0
+_ollama_status: Dict[str, Any] = {'ok': None, 'ts': 0.0}
+_ollama_lock = asyncio.Lock()
+
+# Precompiled regex patterns
+_ERROR_PATTERNS = [(re.compile(p), r) for p, r in [
+    (r'"(\[|\(|\{)" was not closed', 'SyntaxError'),
+    (r'"(\]|\)|\})" was never opened', 'SyntaxError'),
+    (r'(\w*Error):', r'\1'),
+    (r'(\w*Exception):', r'\1'),
+    (r'(\w*Warning):', r'\1'),
+]]
+_LINE_NUM_RE = re.compile(r'^\s*\d+:\s*')
+_CONTEXT_LINE_RE = re.compile(r'^[^\S\n]*# (?:File imports|Function context):[^\n]*\n?', re.MULTILINE)
+_NUMBERED_LINE_RE = re.compile(r'^(?![^\n]*>>>)[^\S\n]*\d+:(?:[^\S\n]*(?:\n|\Z)|[^\S\n]*)', re.MULTILINE)
+_MARKER_LINE_RE = re.compile(r'^([^\S\n]*)([^\n]*>>>[^\n]*)(\n?)', re.MULTILINE)
+
+# Ollama prompt; the response patterns below parse the format it asks for
+_PROMPT_TEMPLATE = """You are an expert Python debugger. Fix ALL the following errors in this code.
+
+ERRORS TO FIX:
+{errors}
+
+CURRENT CODE:
+```python
+{code}
+```
+
+Provide EXACTLY this format with clean, executable Python code:
+
+PRIMARY_FIX:
+```python
+[Complete fixed code - ready to copy-paste and run]
+```
+
+PRIMARY_EXPLANATION:
+[Brief explanation of all fixes applied]
+
+PRIMARY_CONFIDENCE: [0.0 to 1.0]
+
+ALTERNATIVE_FIX:
+```python
+[Alternative approach to fix the same issues]
+```
+
+ALTERNATIVE_EXPLANATION:
+[Brief explanation of alternative approach]
+
+ALTERNATIVE_CONFIDENCE: [0.0 to 1.0]
+
+Requirements:
+- Provide complete, clean, executable Python code
+- Fix ALL syntax errors
+- No line numbers or comments in the code
+- Ready to copy-paste and run
+"""
+
+# AI response patterns; (?s) is DOTALL
+_PRIMARY_FIX_RE = re.compile(r'(?s)PRIMARY_FIX:\s*```python\n(.*?)```')
+_PRIMARY_EXPLANATION_RE = re.compile(r'(?s)PRIMARY_EXPLANATION:\s*(.*?)(?:PRIMARY_CONFIDENCE:|ALTERNATIVE_FIX:|$)')
+_PRIMARY_CONFIDENCE_RE = re.compile(r'PRIMARY_CONFIDENCE:\s*([0-9.]+)')
+_ALTERNATIVE_FIX_RE = re.compile(r'(?s)ALTERNATIVE_FIX:\s*```python\n(.*?)```')
+_ALTERNATIVE_EXPLANATION_RE = re.compile(r'(?s)ALTERNATIVE_EXPLANATION:\s*(.*?)(?:ALTERNATIVE_CONFIDENCE:|$)')
+_ALTERNATIVE_CONFIDENCE_RE = re.compile(r'ALTERNATIVE_CONFIDENCE:\s*([0-9.]+)')
+# Fields in the order the prompt asks for them
+_AI_FIELD_PATTERNS = (
+    ('pfix', _PRIMARY_FIX_RE),
+    ('pexp', _PRIMARY_EXPLANATION_RE),
+    ('pconf', _PRIMARY_CONFIDENCE_RE),
+    ('afix', _ALTERNATIVE_FIX_RE),
+    ('aexp', _ALTERNATIVE_EXPLANATION_RE),
+    ('aconf', _ALTERNATIVE_CONFIDENCE_RE),
+)
+
 # Enhanced Data Models
 class ErrorRequest(BaseModel):
     error_message: str
@@ -33,6 +125,9 @@ class BatchErrorRequest(BaseModel):
     file_path: str
 
 class ConsolidatedFix(BaseModel):
+    # Cached instances are shared between responses, so keep them immutable
+    model_config = ConfigDict(frozen=True)
+
     primary_fix: str
     primary_explanation: str
     primary_confidence: float
@@ -47,37 +142,45 @@ class ConsolidatedFixResponse(BaseModel):
     processing_time: float
     success: bool
 
+# Static fields of the fix returned when processing fails
+_FALLBACK_FIX = ConsolidatedFix(
+    primary_fix="",
+    primary_explanation="",
+    primary_confidence=0.1,
+    alternative_fix="",
+    alternative_explanation="Manual review required",
+    alternative_confidence=0.1,
+    errors_fixed=[],
+    total_errors=0
+)
+
+class AIBusyError(Exception):
+    """Raised when every Ollama generate slot is taken"""
+
 # Cache System
 class FixCache:
     def __init__(self, max_size: int = 1000):
-        self.cache: Dict[str, Dict[str, Any]] = {}
-        self.access_times: Dict[str, float] = {}
+        self.cache: OrderedDict[str, ConsolidatedFix] = OrderedDict()
         self.max_size = max_size
         self.hit_count = 0
         self.total_requests = 0
 
-    def _make_key(self, errors_signature: str) -> str:
-        return hashlib.md5(errors_signature.encode()).hexdigest()
-
-    def get(self, errors_signature: str) -> Optional[Dict[str, Any]]:
+    def get(self, errors_signature: str) -> Optional[ConsolidatedFix]:
         self.total_requests += 1
-        key = self._make_key(errors_signature)
-        if key in self.cache:
+        if errors_signature in self.cache:
             self.hit_count += 1
-            self.access_times[key] = time.time()
-            return self.cache[key]
+            # Insertion order is recency: most recently used entries live at the end
+            self.cache.move_to_end(errors_signature)
+            return self.cache[errors_signature]
         return None
 
-    def set(self, errors_signature: str, fix: Dict[str, Any]) -> None:
-        key = self._make_key(errors_signature)
-        
-        if len(self.cache) >= self.max_size:
-            oldest_key = min(self.access_times, key=self.access_times.get)
-            del self.cache[oldest_key]
-            del self.access_times[oldest_key]
+    def set(self, errors_signature: str, fix: ConsolidatedFix) -> None:
+        if errors_signature in self.cache:
+            self.cache.move_to_end(errors_signature)
+        self.cache[errors_signature] = fix
 
-        self.cache[key] = fix
-        self.access_times[key] = time.time()
+        if len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
 
     def stats(self) -> Dict[str, Any]:
         hit_rate = self.hit_count / max(self.total_requests, 1)
@@ -100,27 +203,19 @@ class ErrorParser:
         lines = error_message.strip().split('\n')
         error_line = lines[-1] if lines else ""
 
-        # Enhanced error type detection
-        error_patterns = [
-            (r'"(\[|\(|\{)" was not closed', 'SyntaxError'),
-            (r'"(\]|\)|\})" was never opened', 'SyntaxError'),
-            (r'(\w*Error):', r'\1'),
-            (r'(\w*Exception):', r'\1'),
-            (r'(\w*Warning):', r'\1'),
-        ]
-
         error_type = "SyntaxError"
         error_detail = error_line
 
-        for pattern, replacement in error_patterns:
-            match = re.search(pattern, error_line)
+        # Enhanced error type detection
+        for pattern, replacement in _ERROR_PATTERNS:
+            match = pattern.search(error_line)
             if match:
                 if replacement in ['SyntaxError']:
                     error_type = replacement
                     error_detail = error_line
                 else:
                     error_type = match.group(1)
-                    error_detail = re.sub(pattern, '', error_line).strip()
+                    error_detail = pattern.sub('', error_line).strip()
                 break
 
         return {
@@ -134,45 +229,56 @@ class CleanCodeExtractor:
     @staticmethod
     def extract_clean_code(code_snippet: str) -> str:
         """Extract clean code without line numbers and markers"""
-        lines = code_snippet.split('\n')
-        clean_lines = []
-        
-        for line in lines:
-            # Skip comment lines that are just context
-            if line.strip().startswith('# File imports:') or line.strip().startswith('# Function context:'):
-                continue
-            
-            # Remove line numbers and markers
-            clean_line = line
-            
-            # Remove >>> markers
-            if '>>>' in clean_line:
-                clean_line = clean_line.replace('>>>', '').strip()
-                # Find the indentation from the original line
-                original_indent = len(line) - len(line.lstrip())
-                clean_line = ' ' * (original_indent - 4) + clean_line  # Adjust for >>> removal
-            
-            # Remove line number patterns like "    23: "
-            clean_line = re.sub(r'^\s*\d+:\s*', '', clean_line)
-            
-            # Skip empty lines that were just line numbers
-            if clean_line.strip() or not line.strip():
-                clean_lines.append(clean_line)
-        
-        return '\n'.join(clean_lines).strip()
+        # Skip comment lines that are just context
+        clean_code = _CONTEXT_LINE_RE.sub('', code_snippet)
+
+        # Remove line number patterns like "    23: ", dropping lines that were just line numbers
+        clean_code = _NUMBERED_LINE_RE.sub('', clean_code)
+
+        # Remove >>> markers
+        clean_code = _MARKER_LINE_RE.sub(CleanCodeExtractor._clean_marker_line, clean_code)
+
+        return clean_code.strip()
+
+    @staticmethod
+    def _clean_marker_line(match: re.Match) -> str:
+        """Strip the >>> marker from one line, keeping its indentation"""
+        indent, line, newline = match.groups()
+        clean_line = ' ' * (len(indent) - 4) + line.replace('>>>', '').strip()  # Adjust for >>> removal
+        clean_line = _LINE_NUM_RE.sub('', clean_line)
+        return clean_line + newline if clean_line.strip() else ''
+
+def _bracket_counts(code: str) -> Tuple[int, int, int, int]:
+    """Count open/close brackets and parentheses in code"""
+    return code.count('['), code.count(']'), code.count('('), code.count(')')
 
 # Enhanced Consolidated Fix Generator
 class ConsolidatedFixGenerator:
     @staticmethod
     async def check_ollama_status() -> bool:
-        """Check if Ollama is running"""
+        """Check if Ollama is running, reusing a recent result"""
+        if _ollama_status['ok'] is not None and time.monotonic() - _ollama_status['ts'] < OLLAMA_STATUS_TTL:
+            return _ollama_status['ok']
+
+        # Only one probe in flight; concurrent callers wait for its result
+        async with _ollama_lock:
+            if _ollama_status['ok'] is not None and time.monotonic() - _ollama_status['ts'] < OLLAMA_STATUS_TTL:
+                return _ollama_status['ok']
+
+            ok = await ConsolidatedFixGenerator._probe_ollama()
+            _ollama_status['ok'] = ok
+            _ollama_status['ts'] = time.monotonic()
+            return ok
+
+    @staticmethod
+    async def _probe_ollama() -> bool:
+        """Ask Ollama for its model list"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    "http://localhost:11434/api/tags",
-                    timeout=aiohttp.ClientTimeout(total=5)
-                ) as response:
-                    return response.status == 200
+            async with SESSION.get(
+                "http://localhost:11434/api/tags",
+                timeout=_HEALTH_TIMEOUT
+            ) as response:
+                return response.status == 200
         except:
             return False
 
@@ -180,29 +286,36 @@ class ConsolidatedFixGenerator:
     async def generate_consolidated_fix(batch_request: BatchErrorRequest) -> ConsolidatedFix:
         """Generate one consolidated fix for all errors"""
         
-        # Create signature for caching
-        errors_signature = '|'.join([f"{e.error_message}:{e.line_number}" for e in batch_request.errors])
+        # Create signature for caching (the cache is per-process, so hash() is stable enough
+        # and keeps long tracebacks out of the key)
+        errors_signature = '|'.join([f"{hash(e.error_message)}:{e.line_number}" for e in batch_request.errors])
         
         # Check cache
         cached_fix = fix_cache.get(errors_signature)
-        if cached_fix:
-            return ConsolidatedFix(**cached_fix)
+        if cached_fix is not None:
+            return cached_fix
 
         # Extract clean code from the first error (they should all have the same code)
         clean_code = CleanCodeExtractor.extract_clean_code(batch_request.errors[0].code_snippet)
         
-        # Parse all errors
+        # Parse all errors once into (error_type, error_detail, line_number) tuples,
+        # formatting the descriptions and the AI prompt summary along the way
         parsed_errors = []
         error_descriptions = []
+        error_summary = []
         
-        for error_item in batch_request.errors:
+        for i, error_item in enumerate(batch_request.errors, 1):
             parsed_error = ErrorParser.parse_python_error(error_item.error_message)
-            parsed_errors.append(parsed_error)
-            error_descriptions.append(f"Line {error_item.line_number}: {parsed_error['error_detail']}")
+            error_type = parsed_error['error_type']
+            error_detail = parsed_error['error_detail']
+            line_number = str(error_item.line_number)
+            parsed_errors.append((error_type, error_detail, line_number))
+            error_descriptions.append(f"Line {line_number}: {error_detail}")
+            error_summary.append(f"Error {i}: {error_type} - {error_detail}")
 
         # Generate consolidated fix
         primary_fix, alternative_fix, explanations, confidences = await ConsolidatedFixGenerator._generate_fixes(
-            clean_code, parsed_errors, batch_request.file_path
+            clean_code, parsed_errors, error_summary, batch_request.file_path
         )
 
         consolidated_fix = ConsolidatedFix(
@@ -216,13 +329,14 @@ class ConsolidatedFixGenerator:
             total_errors=len(batch_request.errors)
         )
 
-        # Cache the result
-        fix_cache.set(errors_signature, consolidated_fix.dict())
+        # Cache the validated model itself; it is never mutated after this point
+        fix_cache.set(errors_signature, consolidated_fix)
         
         return consolidated_fix
 
     @staticmethod
-    async def _generate_fixes(clean_code: str, parsed_errors: List[Dict], file_path: str) -> tuple:
+    async def _generate_fixes(clean_code: str, parsed_errors: List[Tuple[str, str, str]],
+                              error_summary: List[str], file_path: str) -> tuple:
         """Generate primary and alternative fixes"""
         
         # Try AI-based fix first
@@ -230,7 +344,11 @@ class ConsolidatedFixGenerator:
         
         if ollama_available:
             try:
-                return await ConsolidatedFixGenerator._generate_ai_fixes(clean_code, parsed_errors, file_path)
+                return await ConsolidatedFixGenerator._generate_ai_fixes(
+                    clean_code, parsed_errors, error_summary, file_path
+                )
+            except AIBusyError:
+                raise
             except Exception as e:
                 logger.error(f"AI fix generation failed: {e}")
         
@@ -238,78 +356,37 @@ class ConsolidatedFixGenerator:
         return ConsolidatedFixGenerator._generate_rule_based_fixes(clean_code, parsed_errors)
 
     @staticmethod
-    async def _generate_ai_fixes(clean_code: str, parsed_errors: List[Dict], file_path: str) -> tuple:
+    async def _generate_ai_fixes(clean_code: str, parsed_errors: List[Tuple[str, str, str]],
+                                 error_summary: List[str], file_path: str) -> tuple:
         """Generate AI-based fixes"""
         
-        # Create consolidated error description
-        error_summary = []
-        for i, error in enumerate(parsed_errors, 1):
-            error_summary.append(f"Error {i}: {error['error_type']} - {error['error_detail']}")
-        
-        prompt = f"""You are an expert Python debugger. Fix ALL the following errors in this code.
-
-ERRORS TO FIX:
-{chr(10).join(error_summary)}
-
-CURRENT CODE:
-```python
-{clean_code}
-```
-
-Provide EXACTLY this format with clean, executable Python code:
-
-PRIMARY_FIX:
-```python
-[Complete fixed code - ready to copy-paste and run]
-```
-
-PRIMARY_EXPLANATION:
-[Brief explanation of all fixes applied]
-
-PRIMARY_CONFIDENCE: [0.0 to 1.0]
-
-ALTERNATIVE_FIX:
-```python
-[Alternative approach to fix the same issues]
-```
-
-ALTERNATIVE_EXPLANATION:
-[Brief explanation of alternative approach]
-
-ALTERNATIVE_CONFIDENCE: [0.0 to 1.0]
-
-Requirements:
-- Provide complete, clean, executable Python code
-- Fix ALL syntax errors
-- No line numbers or comments in the code
-- Ready to copy-paste and run
-"""
+        prompt = _PROMPT_TEMPLATE.format(errors='\n'.join(error_summary), code=clean_code)
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
+            # Check and acquire with no await in between, so the cap holds
+            if _AI_SEM.locked():
+                raise AIBusyError("All Ollama generate slots are in use")
+            async with _AI_SEM:
+                async with SESSION.post(
                     "http://localhost:11434/api/generate",
-                    json={
+                    data=orjson.dumps({
                         "model": "codellama:latest",
                         "prompt": prompt,
                         "stream": False,
-                        "options": {
-                            "temperature": 0.1,
-                            "top_p": 0.8,
-                            "num_predict": 500,
-                            "num_thread": 6,
-                            "repeat_penalty": 1.2
-                        }
-                    },
-                    timeout=aiohttp.ClientTimeout(total=60)
+                        "options": _OLLAMA_OPTIONS
+                    }),
+                    headers=_JSON_HEADERS,
+                    timeout=_GEN_TIMEOUT
                 ) as response:
                     
                     if response.status == 200:
-                        result = await response.json()
+                        result = orjson.loads(await response.read())
                         ai_response = result.get('response', '')
                         
                         return ConsolidatedFixGenerator._parse_ai_response(ai_response, clean_code)
         
+        except AIBusyError:
+            raise
         except Exception as e:
             logger.error(f"AI request failed: {e}")
         
@@ -329,35 +406,31 @@ Requirements:
         alternative_confidence = 0.7
 
         try:
+            fields = ConsolidatedFixGenerator._search_ai_fields(ai_response)
+
             # Extract PRIMARY_FIX
-            primary_match = re.search(r'PRIMARY_FIX:\s*```python\n(.*?)```', ai_response, re.DOTALL)
-            if primary_match:
-                primary_fix = primary_match.group(1).strip()
+            if fields['pfix'] is not None:
+                primary_fix = fields['pfix'].strip()
 
             # Extract PRIMARY_EXPLANATION
-            primary_exp_match = re.search(r'PRIMARY_EXPLANATION:\s*(.*?)(?=PRIMARY_CONFIDENCE:|ALTERNATIVE_FIX:|$)', ai_response, re.DOTALL)
-            if primary_exp_match:
-                primary_explanation = primary_exp_match.group(1).strip()
+            if fields['pexp'] is not None:
+                primary_explanation = fields['pexp'].strip()
 
             # Extract PRIMARY_CONFIDENCE
-            primary_conf_match = re.search(r'PRIMARY_CONFIDENCE:\s*([0-9.]+)', ai_response)
-            if primary_conf_match:
-                primary_confidence = min(1.0, max(0.0, float(primary_conf_match.group(1))))
+            if fields['pconf'] is not None:
+                primary_confidence = min(1.0, max(0.0, float(fields['pconf'])))
 
             # Extract ALTERNATIVE_FIX
-            alt_match = re.search(r'ALTERNATIVE_FIX:\s*```python\n(.*?)```', ai_response, re.DOTALL)
-            if alt_match:
-                alternative_fix = alt_match.group(1).strip()
+            if fields['afix'] is not None:
+                alternative_fix = fields['afix'].strip()
 
             # Extract ALTERNATIVE_EXPLANATION
-            alt_exp_match = re.search(r'ALTERNATIVE_EXPLANATION:\s*(.*?)(?=ALTERNATIVE_CONFIDENCE:|$)', ai_response, re.DOTALL)
-            if alt_exp_match:
-                alternative_explanation = alt_exp_match.group(1).strip()
+            if fields['aexp'] is not None:
+                alternative_explanation = fields['aexp'].strip()
 
             # Extract ALTERNATIVE_CONFIDENCE
-            alt_conf_match = re.search(r'ALTERNATIVE_CONFIDENCE:\s*([0-9.]+)', ai_response)
-            if alt_conf_match:
-                alternative_confidence = min(1.0, max(0.0, float(alt_conf_match.group(1))))
+            if fields['aconf'] is not None:
+                alternative_confidence = min(1.0, max(0.0, float(fields['aconf'])))
 
         except Exception as e:
             logger.error(f"Error parsing AI response: {e}")
@@ -375,46 +448,80 @@ Requirements:
         return primary_fix, alternative_fix, explanations, confidences
 
     @staticmethod
-    def _generate_rule_based_fixes(clean_code: str, parsed_errors: List[Dict]) -> tuple:
+    def _search_ai_fields(ai_response: str) -> Dict[str, Optional[str]]:
+        """Search AI response fields in order, each from where the previous field ended"""
+        # One pattern per search, so the lazy groups never nest and a looping
+        # response cannot make the engine backtrack across sections
+        fields = {}
+        pos = 0
+        for name, pattern in _AI_FIELD_PATTERNS:
+            field_match = pattern.search(ai_response, pos)
+            if field_match:
+                pos = field_match.end(1)
+            elif pos:
+                # Partial or reordered response: look for the field anywhere
+                field_match = pattern.search(ai_response)
+            fields[name] = field_match.group(1) if field_match else None
+        return fields
+
+    @staticmethod
+    def _generate_rule_based_fixes(clean_code: str, parsed_errors: List[Tuple[str, str, str]]) -> tuple:
         """Generate rule-based fixes for common syntax errors"""
         
         primary_fix = clean_code
         alternative_fix = clean_code
         
         fixed_issues = []
+
+        # Collect the rules to apply in error order. Bracket rules only need to run once;
+        # the statements rule is re-run only when another rule ran in between.
+        # Once every rule has run and nothing follows the statements rule, the rest is a no-op.
+        rules = []
+        for error_type, error_detail, _ in parsed_errors:
+            if error_type != 'SyntaxError':
+                continue
+            if '"[" was not closed' in error_detail:
+                rule = 'brackets'
+            elif '"(" was not closed' in error_detail:
+                rule = 'parens'
+            elif 'Statements must be separated' in error_detail:
+                rule = 'statements'
+            else:
+                continue
+            if rule not in rules or (rule == 'statements' and rules[-1] != 'statements'):
+                rules.append(rule)
+                if rule == 'statements' and 'brackets' in rules and 'parens' in rules:
+                    break
+
+        # Count brackets once, and only when some rule applies
+        if rules:
+            open_brackets, close_brackets, open_parens, close_parens = _bracket_counts(primary_fix)
         
         # Apply fixes for each error type
-        for error in parsed_errors:
-            error_type = error['error_type']
-            error_detail = error['error_detail']
+        for rule in rules:
+            if rule == 'brackets':
+                # Fix missing closing brackets
+                if open_brackets > close_brackets:
+                    missing = open_brackets - close_brackets
+                    primary_fix = primary_fix + ']' * missing
+                    alternative_fix = primary_fix.replace('[', '', missing)  # Remove extra opening brackets
+                    fixed_issues.append(f"Added {missing} missing closing bracket(s)")
             
-            if error_type == 'SyntaxError':
-                if '"[" was not closed' in error_detail:
-                    # Fix missing closing brackets
-                    open_brackets = primary_fix.count('[')
-                    close_brackets = primary_fix.count(']')
-                    if open_brackets > close_brackets:
-                        missing = open_brackets - close_brackets
-                        primary_fix = primary_fix + ']' * missing
-                        alternative_fix = primary_fix.replace('[', '', missing)  # Remove extra opening brackets
-                        fixed_issues.append(f"Added {missing} missing closing bracket(s)")
-                
-                elif '"(" was not closed' in error_detail:
-                    # Fix missing closing parentheses
-                    open_parens = primary_fix.count('(')
-                    close_parens = primary_fix.count(')')
-                    if open_parens > close_parens:
-                        missing = open_parens - close_parens
-                        primary_fix = primary_fix + ')' * missing
-                        alternative_fix = primary_fix.replace('(', '', missing)  # Remove extra opening parens
-                        fixed_issues.append(f"Added {missing} missing closing parenthesis/parentheses")
-                
-                elif 'Statements must be separated' in error_detail:
-                    # This often means missing punctuation
-                    if 'writer.writerow' in primary_fix and not primary_fix.rstrip().endswith(')'):
-                        primary_fix = primary_fix.rstrip() + ')'
-                        alternative_fix = primary_fix
-                        fixed_issues.append("Added missing closing parenthesis for function call")
+            elif rule == 'parens':
+                # Fix missing closing parentheses
+                if open_parens > close_parens:
+                    missing = open_parens - close_parens
+                    primary_fix = primary_fix + ')' * missing
+                    alternative_fix = primary_fix.replace('(', '', missing)  # Remove extra opening parens
+                    fixed_issues.append(f"Added {missing} missing closing parenthesis/parentheses")
+            
+            elif rule == 'statements':
+                # This often means missing punctuation
+                if 'writer.writerow' in primary_fix and not primary_fix.rstrip().endswith(')'):
+                    primary_fix = primary_fix.rstrip() + ')'
+                    close_parens += 1
+                    alternative_fix = primary_fix
+                    fixed_issues.append("Added missing closing parenthesis for function call")
 
         explanations = {
             'primary': f"Fixed syntax errors: {', '.join(fixed_issues) if fixed_issues else 'Applied standard fixes'}",
@@ -433,13 +540,13 @@ class ConsolidatedBatchProcessor:
     @staticmethod
     async def process_consolidated_batch(batch_request: BatchErrorRequest) -> ConsolidatedFixResponse:
         """Process all errors and return one consolidated fix"""
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         logger.info(f"Processing consolidated batch of {len(batch_request.errors)} errors")
         
         try:
             consolidated_fix = await ConsolidatedFixGenerator.generate_consolidated_fix(batch_request)
-            processing_time = time.time() - start_time
+            processing_time = time.perf_counter() - start_time
             
             logger.info(f"Consolidated fix generated successfully in {processing_time:.2f}s")
             
@@ -449,23 +556,22 @@ class ConsolidatedBatchProcessor:
                 success=True
             )
             
+        except AIBusyError:
+            raise
         except Exception as e:
-            processing_time = time.time() - start_time
+            processing_time = time.perf_counter() - start_time
             logger.error(f"Consolidated processing failed: {e}")
             
             # Return fallback response
             clean_code = CleanCodeExtractor.extract_clean_code(batch_request.errors[0].code_snippet)
             
-            fallback_fix = ConsolidatedFix(
-                primary_fix=clean_code,
-                primary_explanation=f"Processing failed: {str(e)}",
-                primary_confidence=0.1,
-                alternative_fix=f"# TODO: Fix errors manually\n{clean_code}",
-                alternative_explanation="Manual review required",
-                alternative_confidence=0.1,
-                errors_fixed=[f"Error processing: {str(e)}"],
-                total_errors=len(batch_request.errors)
-            )
+            fallback_fix = _FALLBACK_FIX.model_copy(update={
+                'primary_fix': clean_code,
+                'primary_explanation': f"Processing failed: {str(e)}",
+                'alternative_fix': f"# TODO: Fix errors manually\n{clean_code}",
+                'errors_fixed': [f"Error processing: {str(e)}"],
+                'total_errors': len(batch_request.errors)
+            })
             
             return ConsolidatedFixResponse(
                 consolidated_fix=fallback_fix,
@@ -473,11 +579,37 @@ class ConsolidatedBatchProcessor:
                 success=False
             )
 
+# Pure ASGI middleware (no BaseHTTPMiddleware: avoids an extra task and Request/Response per call)
+class RequestTimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-response-time", f"{time.perf_counter() - start_time:.4f}s".encode()))
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_timing)
+
 # Application setup
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global SESSION
     logger.info("🚀 Starting Consolidated AI Error Fixer API...")
+    SESSION = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=64, limit_per_host=32, keepalive_timeout=75)
+    )
     yield
+    await SESSION.close()
     logger.info("👋 Shutting down Consolidated AI Error Fixer API...")
 
 app = FastAPI(
@@ -487,6 +619,10 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Middleware order: each add_middleware call wraps the previous ones, so the
+# last one added runs first. Keep every middleware pure ASGI.
+#   1. RequestTimingMiddleware - outermost, times the full request including CORS
+#   2. CORSMiddleware          - answers preflights and adds CORS headers
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -494,6 +630,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestTimingMiddleware)
 
 # API Endpoints
 @app.get("/health")
@@ -527,6 +664,8 @@ async def fix_errors_consolidated(request: BatchErrorRequest):
         result = await ConsolidatedBatchProcessor.process_consolidated_batch(request)
         return result
         
+    except AIBusyError:
+        raise HTTPException(status_code=429, detail="Too many fixes in progress. Please retry shortly.")
     except HTTPException:
         raise
     except Exception as e: